@@ -1,12 +1,25 @@
-import json
+import asyncio
+import cProfile
+import functools
+import io
 import os
+import pstats
 import threading
-from datetime import datetime
+import tracemalloc
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from time import perf_counter
+import numpy as np
 import pytz
 from dotenv import load_dotenv
-from telegram.ext import Application, CommandHandler
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+from telegram.error import RetryAfter
+from telegram.ext import Application, CommandHandler, InlineQueryHandler
 from flask import Flask
 import re
+from calendar_data import load_data
 
 app = Flask(__name__)
 
@@ -28,9 +41,13 @@ def start_health_server():
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
+TIMEZONE = pytz.timezone("Asia/Bangkok")
+# Telegram user IDs allowed to run admin commands (comma-separated)
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
 
-with open("lich_van_nien_thoigian_2025.json", "r", encoding="utf-8") as f:
-    fengshui_data = json.load(f)
+# Accepts both the legacy (schema 1) and catalog (schema 2) data files
+fengshui_data, fengshui_doc = load_data("lich_van_nien_thoigian_2025.json")
 
 
 def clean_all(val):
@@ -259,6 +276,199 @@ def build_today_message(data):
     return escape_leading_dash_per_line(msg_full)
 
 
+# Hour index: each day's "all-time" list parsed once into sorted minute
+# intervals so /now and the hour alerts are a bisect instead of a regex pass.
+HourSlot = namedtuple("HourSlot", "start end good name deity")
+
+GOOD_HOUR_DEITIES = {
+    "Kim quỹ",
+    "Kim đường (Bảo quang)",
+    "Ngọc đường",
+    "Tư mệnh",
+    "Thanh long",
+    "Minh đường",
+}
+
+
+def parse_clock(text):
+    hours, minutes = text.strip().split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def format_clock(minutes):
+    minutes %= 24 * 60
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+def parse_hour_slots(time_str):
+    # "Nhâm Tí (0:00 - 1:00 & 23:00 - 0:00) - Tư mệnh - 🔴" -> one slot per range
+    m = re.match(
+        r"([^\(]+)\(([^\)]+)\)\s*-\s*(.*?)(?:\s*-\s*(🔴|⚫️))?$", str(time_str)
+    )
+    if not m:
+        return []
+    name = m.group(1).strip()
+    deity = m.group(3).strip()
+    # Some scraped hours lost their dot (e.g. "Kim đường (Bảo quang)")
+    good = m.group(4) == "🔴" if m.group(4) else deity in GOOD_HOUR_DEITIES
+    slots = []
+    for part in m.group(2).split("&"):
+        start_str, end_str = part.split("-")
+        start = parse_clock(start_str)
+        end = parse_clock(end_str)
+        if end <= start:
+            end += 24 * 60  # "23:00 - 0:00" ends at midnight
+        slots.append(HourSlot(start, end, good, name, deity))
+    return slots
+
+
+def build_day_hours(all_time):
+    """Return (starts, slots) for one day, sorted by start minute."""
+    by_start = {}
+    for t in all_time:
+        for slot in parse_hour_slots(t):
+            by_start.setdefault(slot.start, slot)
+    slots = [by_start[k] for k in sorted(by_start)]
+    return [slot.start for slot in slots], slots
+
+
+def build_hour_index(data):
+    return {
+        date_str: build_day_hours(day.get("all-time", []))
+        for date_str, day in data.items()
+    }
+
+
+hour_index = build_hour_index(fengshui_data)
+hour_dates = sorted(hour_index)
+
+
+def find_hour_slot(moment):
+    """Return the HourSlot covering a tz-aware datetime, or None."""
+    entry = hour_index.get(moment.strftime("%Y-%m-%d"))
+    if not entry:
+        return None
+    starts, slots = entry
+    i = bisect_right(starts, moment.hour * 60 + moment.minute) - 1
+    return slots[i] if i >= 0 else None
+
+
+def iter_upcoming_slots(moment):
+    """Yield (start_datetime, slot) for every hour starting after moment.
+
+    Dates missing from the data are skipped, not treated as the end. The Tí
+    hour wraps midnight, so a 0:00 slot with the same polarity as the 23:00
+    slot of the day before is a continuation and is not yielded.
+    """
+    prev = None
+    prev_day = None
+    for date_str in hour_dates[bisect_left(hour_dates, moment.strftime("%Y-%m-%d")) :]:
+        day = datetime.strptime(date_str, "%Y-%m-%d").date()
+        if prev_day is None or day - prev_day != timedelta(days=1):
+            prev = None  # a gap: the 23:00 slot before isn't adjacent
+        day_start = TIMEZONE.localize(datetime.combine(day, time.min))
+        for slot in hour_index[date_str][1]:
+            start_dt = day_start + timedelta(minutes=slot.start)
+            continuation = (
+                slot.start == 0 and prev is not None and prev.good == slot.good
+            )
+            if start_dt > moment and not continuation:
+                yield start_dt, slot
+            prev = slot
+        prev_day = day
+
+
+def next_good_slot(moment):
+    return next(((dt, s) for dt, s in iter_upcoming_slots(moment) if s.good), None)
+
+
+def format_hour_slot(slot):
+    icon = "🔴" if slot.good else "⚫️"
+    kind = "Giờ hoàng đạo" if slot.good else "Giờ hắc đạo"
+    return (
+        f"{icon} {kind}: {slot.name} - {slot.deity}\n"
+        f"└ ({format_clock(slot.start)} - {format_clock(slot.end)})"
+    )
+
+
+def build_now_message(moment):
+    slot = find_hour_slot(moment)
+    if not slot:
+        return None
+    lines = [
+        safe_bold(esc(f"🕑 BÂY GIỜ: {moment.strftime('%H:%M')}")),
+        esc(format_hour_slot(slot)),
+    ]
+    upcoming = next_good_slot(moment)
+    if upcoming:
+        start_dt, good = upcoming
+        lines.append(
+            safe_bold(esc("⏭️ Giờ tốt tiếp theo:"))
+            + "\n"
+            + esc(f"{good.name} - {good.deity}, lúc {start_dt.strftime('%H:%M %d/%m')}")
+        )
+    return escape_leading_dash_per_line("\n\n".join(lines))
+
+
+async def now(update, context):
+    msg = build_now_message(datetime.now(TIMEZONE))
+    if not msg:
+        await update.message.reply_text("No data found for now.")
+        return
+    await update.message.reply_text(msg, parse_mode="MarkdownV2")
+
+
+# Chats that opted in with /alerts on (in-memory, like the rest of the bot)
+hour_alert_chats = set()
+
+
+async def alerts(update, context):
+    chat_id = update.effective_chat.id
+    arg = context.args[0].lower() if context.args else ""
+    if arg == "on":
+        hour_alert_chats.add(chat_id)
+        await update.message.reply_text(
+            "Đã bật thông báo đầu mỗi giờ hoàng đạo/hắc đạo. Dùng /alerts off để tắt."
+        )
+    elif arg == "off":
+        hour_alert_chats.discard(chat_id)
+        await update.message.reply_text("Đã tắt thông báo giờ.")
+    else:
+        state = "bật" if chat_id in hour_alert_chats else "tắt"
+        await update.message.reply_text(
+            f"Thông báo giờ đang {state}. Dùng /alerts on hoặc /alerts off."
+        )
+
+
+def schedule_hour_alert(job_queue, after):
+    """Queue a single wake-up at the next hour boundary after `after`."""
+    upcoming = next(iter_upcoming_slots(after), None)
+    if not upcoming:
+        print(f"No hour data after {after}, hour alerts stopped")
+        return
+    start_dt, _ = upcoming
+    job_queue.run_once(
+        profiled(hour_alert), when=start_dt, data=start_dt, name="hour_alert"
+    )
+
+
+async def hour_alert(context):
+    """Announce the hour that starts now, then sleep until the next boundary."""
+    boundary = context.job.data
+    schedule_hour_alert(context.job_queue, boundary)
+    slot = find_hour_slot(boundary)
+    if not slot:
+        return
+    message = escape_leading_dash_per_line(esc("🔔 " + format_hour_slot(slot)))
+    for chat_id in list(hour_alert_chats):
+        try:
+            await context.bot.send_message(
+                chat_id=chat_id, text=message, parse_mode="MarkdownV2"
+            )
+        except Exception as e:
+            print(f"Failed to send hour alert to {chat_id}: {e}")
+
+
 async def today(update, context):
     today_str = datetime.now(pytz.timezone("Asia/Bangkok")).strftime("%Y-%m-%d")
     data = fengshui_data.get(today_str)
@@ -295,27 +505,801 @@ async def daily_today(context):
         )
 
 
+# Best day ranking: per-date features are packed into NumPy arrays once at
+# startup, so ranking any window for any age is a slice, a matmul and a sort.
+ACTIVITY_RULES = {
+    "cuoi": {
+        "label": "Cưới hỏi",
+        "aliases": ["cưới", "cuoi-hoi", "giathu", "wedding"],
+        "keywords": ["giá thú"],
+    },
+    "khaitruong": {
+        "label": "Khai trương, cầu tài",
+        "aliases": ["khai-truong", "cautai", "opening", "shop", "business"],
+        "keywords": ["khai trương", "cầu tài", "giao dịch", "tài lộc", "kinh doanh"],
+    },
+    "xuathanh": {
+        "label": "Xuất hành, di chuyển",
+        "aliases": ["xuat-hanh", "dichuyen", "travel"],
+        "keywords": ["xuất hành", "di chuyển"],
+    },
+    "xaydung": {
+        "label": "Động thổ, xây dựng",
+        "aliases": ["xay-dung", "dongtho", "build", "construction"],
+        "keywords": ["động thổ", "xây dựng", "khởi công", "khởi tạo", "làm nhà"],
+    },
+    "antang": {
+        "label": "An táng",
+        "aliases": ["an-tang", "maitang", "funeral"],
+        "keywords": ["an táng", "mai táng", "tang tế"],
+    },
+    "tetu": {
+        "label": "Tế tự, cầu phúc",
+        "aliases": ["te-tu", "cauphuc", "worship"],
+        "keywords": ["tế tự", "cầu phúc"],
+    },
+}
+
+# Configurable: score contribution of each feature
+SCORE_WEIGHTS = {
+    "star-match": 3.0,  # star description names the activity
+    "star-great": 2.0,  # "Đại cát" / "Đại hung"
+    "star-general": 1.0,  # plain "Tốt" / "Xấu"
+    "division-match": 3.0,
+    "division-general": 2.0,  # "Tốt mọi việc" / "Xấu mọi việc"
+    "division-avoid": -4.0,  # division says to avoid the activity
+    "good-hour": 0.25,  # per auspicious double-hour
+    "bad-for-age": -10.0,  # the day is kỵ for the user's age
+}
+
+
+def fold_text(text):
+    """Lowercase, collapse spaces and strip Vietnamese diacritics for lookups."""
+    text = " ".join(str(text).split()).lower().replace("đ", "d")
+    text = unicodedata.normalize("NFD", text)
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def find_age(text):
+    """Return the feature column of a Can Chi age such as "Đinh Mão", or None."""
+    # The data spells the first branch "Tí"
+    key = " ".join(str(text).split()).lower().replace("tý", "tí")
+    age_pos = day_features["age-pos"]
+    return age_pos.get(key, age_pos.get(fold_text(key)))
+
+
+activity_lookup = {}
+for key, rule in ACTIVITY_RULES.items():
+    for alias in [key, rule["label"], *rule["aliases"]]:
+        activity_lookup[fold_text(alias).replace(" ", "").replace("-", "")] = key
+
+
+def star_parts(entry):
+    """Return (base name, is_good, description) for a catalog star entry."""
+    name, detail = next(iter(entry.items()))
+    desc = (detail.get("🍀") or detail.get("⚠️") or "").strip()
+    base = name.replace("🔴", "").replace("⚫️", "").strip()
+    return " ".join(base.split()), "🔴" in name, desc
+
+
+def star_weight(entry, keywords):
+    _, good, desc = star_parts(entry)
+    text = desc.lower()
+    sign = 1 if good else -1
+    if any(k in text for k in keywords):
+        return sign * SCORE_WEIGHTS["star-match"]
+    if "đại cát" in text or "đại hung" in text:
+        return sign * SCORE_WEIGHTS["star-great"]
+    # "Tốt", "Tốt, nhất là giá thú", "Xấu với lợp nhà", ... all count a little
+    if text.startswith(("tốt", "xấu")):
+        return sign * SCORE_WEIGHTS["star-general"]
+    return 0.0
+
+
+def division_weight(division, keywords):
+    text = next(iter(division.values()), "").lower()
+    # "Tốt mọi việc trừ động thổ" -> ("tốt mọi việc ", "động thổ")
+    parts = re.split(r"\b(?:tránh|kỵ|trừ)\b", text, maxsplit=1)
+    favoured, avoided = parts[0], parts[1] if len(parts) > 1 else ""
+    if any(k in avoided for k in keywords):
+        return SCORE_WEIGHTS["division-avoid"]
+    if "xấu mọi việc" in favoured:
+        return -SCORE_WEIGHTS["division-general"]
+    if any(k in favoured for k in keywords):
+        return SCORE_WEIGHTS["division-match"]
+    if "tốt mọi việc" in favoured:
+        return SCORE_WEIGHTS["division-general"]
+    return 0.0
+
+
+def build_day_features(doc, hours):
+    """Pack every date of a schema 2 document into feature arrays.
+
+    `hours` is the hour index, so good hours are counted exactly like /now
+    and /week count them, including entries the scraper left without a dot.
+    """
+    catalog = doc["catalog"]
+    dates = sorted(doc["days"])
+    ages = sorted(
+        {" ".join(a.split()) for d in doc["days"].values() for a in d["bad-for-age"]}
+    )
+    age_pos = {}
+    # Folded keys first so exact spellings win when Tỵ/Tý fold to the same text
+    for i, a in enumerate(ages):
+        age_pos.setdefault(fold_text(a), i)
+    for i, a in enumerate(ages):
+        age_pos[a.lower()] = i
+    stars = np.zeros((len(dates), len(catalog["stars"])), dtype=np.float32)
+    bad_age = np.zeros((len(dates), len(ages)), dtype=bool)
+    division = np.zeros(len(dates), dtype=np.intp)
+    good_hours = np.zeros(len(dates), dtype=np.float32)
+    for i, date_str in enumerate(dates):
+        day = doc["days"][date_str]
+        stars[i, day["auspicious-star"] + day["inauspicious-star"]] = 1
+        bad_age[
+            i, [age_pos[" ".join(a.split()).lower()] for a in day["bad-for-age"]]
+        ] = True
+        division[i] = day["division"]
+        slots = hours.get(date_str, ([], []))[1]
+        # Tí has two slots but is one double-hour
+        good_hours[i] = len({slot.name for slot in slots if slot.good})
+    weights = {}
+    for key, rule in ACTIVITY_RULES.items():
+        weights[key] = (
+            np.array([star_weight(s, rule["keywords"]) for s in catalog["stars"]]),
+            np.array(
+                [division_weight(d, rule["keywords"]) for d in catalog["divisions"]]
+            ),
+        )
+    return {
+        "dates": dates,
+        "date-pos": {d: i for i, d in enumerate(dates)},
+        "ages": ages,
+        "age-pos": age_pos,
+        "stars": stars,
+        "bad-age": bad_age,
+        "division": division,
+        "good-hours": good_hours,
+        "weights": weights,
+    }
+
+
+day_features = build_day_features(fengshui_doc, hour_index)
+
+
+def rank_days(activity, start, end, age=None, top=5):
+    """Return [(date_str, score)] of the best days in [start, end] (ISO strings)."""
+    f = day_features
+    lo = bisect_left(f["dates"], start)
+    hi = bisect_right(f["dates"], end)
+    if lo >= hi:
+        return []
+    star_w, division_w = f["weights"][activity]
+    scores = (
+        f["stars"][lo:hi] @ star_w
+        + division_w[f["division"][lo:hi]]
+        + f["good-hours"][lo:hi] * SCORE_WEIGHTS["good-hour"]
+    )
+    if age is not None:
+        scores = scores + f["bad-age"][lo:hi, age] * SCORE_WEIGHTS["bad-for-age"]
+    # Stable sort keeps the earlier date first on ties
+    best = np.argsort(-scores, kind="stable")[:top]
+    return [(f["dates"][lo + i], float(scores[i])) for i in best]
+
+
+def explain_day(activity, date_str, age=None, limit=3):
+    """Return the reason lines behind a day's score, strongest first."""
+    rule = ACTIVITY_RULES[activity]
+    packed = fengshui_doc["days"][date_str]
+    catalog = fengshui_doc["catalog"]
+    reasons = []
+    division = catalog["divisions"][packed["division"]]
+    div_name, div_text = next(iter(division.items()))
+    div_w = division_weight(division, rule["keywords"])
+    if div_w:
+        reasons.append((abs(div_w), f"🧿 Trực {div_name}: {div_text}"))
+    for star_id in packed["auspicious-star"] + packed["inauspicious-star"]:
+        entry = catalog["stars"][star_id]
+        w = star_weight(entry, rule["keywords"])
+        if w:
+            name, good, desc = star_parts(entry)
+            reasons.append((abs(w), f"{'🍀' if good else '⚠️'} {name}: {desc}"))
+    reasons.sort(key=lambda r: -r[0])
+    lines = [text for _, text in reasons[:limit]]
+    if (
+        age is not None
+        and day_features["bad-age"][day_features["date-pos"][date_str], age]
+    ):
+        lines.insert(0, f"🚫 Kỵ tuổi {day_features['ages'][age]}")
+    return lines
+
+
+def parse_day_range(text, today_date):
+    """Parse "2025-12", "2025-12-01:2025-12-15" or "14d" into (start, end) dates.
+
+    Returns None for anything else, including impossible dates like "2025-13".
+    """
+    try:
+        m = re.fullmatch(r"(\d{4})-(\d{1,2})", text)
+        if m:
+            year, month = int(m.group(1)), int(m.group(2))
+            start = datetime(year, month, 1).date()
+            end = (
+                datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+            ).date()
+            return start, end
+        m = re.fullmatch(r"(\d{4}-\d{2}-\d{2}):(\d{4}-\d{2}-\d{2})", text)
+        if m:
+            start = datetime.strptime(m.group(1), "%Y-%m-%d").date()
+            end = datetime.strptime(m.group(2), "%Y-%m-%d").date()
+            return (start, end) if start <= end else None
+        m = re.fullmatch(r"(\d{1,3})d", text)
+        if m and int(m.group(1)) > 0:
+            return today_date, today_date + timedelta(days=int(m.group(1)) - 1)
+    except (ValueError, OverflowError):
+        pass
+    return None
+
+
+def build_bestday_message(activity, start, end, age=None, top=5):
+    ranked = rank_days(
+        activity, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"), age, top
+    )
+    rule = ACTIVITY_RULES[activity]
+    header = f"{start.strftime('%d/%m/%Y')} - {end.strftime('%d/%m/%Y')}"
+    if age is not None:
+        header += f", tuổi {day_features['ages'][age]}"
+    lines = [
+        safe_bold(esc(f"🏆 NGÀY TỐT: {rule['label'].upper()}")),
+        esc(header),
+    ]
+    if not ranked:
+        lines.append(esc("Không có dữ liệu cho khoảng thời gian này."))
+    for rank, (date_str, score) in enumerate(ranked, 1):
+        day = fengshui_data[date_str]
+        entry = [safe_bold(esc(f"{rank}. {day['date']}")) + esc(f" ({score:+.1f})")]
+        entry.append(esc("└ " + clean_all(day["lunar-date"])))
+        entry.extend(esc("└ " + r) for r in explain_day(activity, date_str, age))
+        lines.append("\n".join(entry))
+    return escape_leading_dash_per_line("\n\n".join(lines))
+
+
+async def bestday(update, context):
+    """/bestday <activity> [YYYY-MM | start:end | Nd] [tuổi <Can Chi>]"""
+    usage = (
+        "Cách dùng: /bestday <việc> [2025-12 | 2025-12-01:2025-12-31 | 30d]"
+        " [tuổi Đinh Mão]\nViệc: " + ", ".join(ACTIVITY_RULES)
+    )
+    args = list(context.args)
+    if not args:
+        await update.message.reply_text(usage)
+        return
+    activity = activity_lookup.get(fold_text(args.pop(0)).replace("-", ""))
+    age = None
+    folded = [fold_text(a) for a in args]
+    if "tuoi" in folded:
+        i = folded.index("tuoi")
+        age = find_age(" ".join(args[i + 1 :]))
+        if age is None:
+            await update.message.reply_text("Không nhận ra tuổi. " + usage)
+            return
+        args = args[:i]
+    today_date = datetime.now(TIMEZONE).date()
+    day_range = parse_day_range(args[0], today_date) if args else None
+    if args and not day_range:
+        activity = None
+    if not activity:
+        await update.message.reply_text(usage)
+        return
+    start, end = day_range or (today_date, today_date + timedelta(days=29))
+    msg = build_bestday_message(activity, start, end, age)
+    await update.message.reply_text(msg, parse_mode="MarkdownV2")
+
+
+# Range summaries (/week, /month): one cached MarkdownV2 fragment per day,
+# packed into as few messages as fit Telegram's limit.
+MESSAGE_LIMIT = 4096
+BATCH_SEND_INTERVAL = 1.0  # seconds between messages of one batch (per-chat limit)
+
+
+def short_lunar_date(lunar_date):
+    # "Ngày 10 Tháng 7, Năm 2025" -> "10/7", "Ngày 1 Tháng Chạp, ..." -> "1/Chạp"
+    m = re.match(r"Ngày (\d+) Tháng (\w+)", str(lunar_date))
+    return f"{m.group(1)}/{m.group(2)}" if m else str(lunar_date)
+
+
+def short_good_hours(date_str):
+    # "Tí (0-1 & 23-0), Dần (3-5), ..." from the hour index
+    ranges = {}
+    for slot in hour_index.get(date_str, ([], []))[1]:
+        if slot.good:
+            branch = slot.name.split()[-1]
+            hours = f"{slot.start // 60}-{slot.end // 60 % 24}"
+            ranges.setdefault(branch, []).append(hours)
+    return ", ".join(f"{b} ({' & '.join(r)})" for b, r in ranges.items())
+
+
+@functools.lru_cache(maxsize=None)
+def build_day_fragment(date_str):
+    """Compact MarkdownV2 block for one day. Every entity opens and closes on
+    its own line, so a message can be split between any two lines."""
+    data = fengshui_data[date_str]
+    day = datetime.strptime(date_str, "%Y-%m-%d")
+    weekday = clean_all(data.get("date")).split(",")[0]
+    division = next(iter(data["division"]), "")
+    lines = [
+        safe_bold(esc(f"📅 {weekday} {day.strftime('%d/%m')}"))
+        + esc(f" · ÂL {short_lunar_date(data.get('lunar-date'))} · Trực {division}"),
+        esc(f"🕑 {short_good_hours(date_str)}"),
+    ]
+    if data.get("bad-for-age"):
+        lines.append(esc("🚫 " + ", ".join(data["bad-for-age"])))
+    return escape_leading_dash_per_line("\n".join(lines))
+
+
+def split_long_line(line, limit):
+    """Hard-split one MarkdownV2 line into chunks of at most `limit` characters.
+
+    A cut never separates a backslash from the character it escapes, and a
+    bold entity spanning a cut is closed and reopened around it.
+    """
+    chunks = []
+    bold = False
+    while True:
+        if bold and line.startswith("*"):
+            # The entity closes right at the cut; the "*" added to the last
+            # chunk already closes it, so don't reopen it empty
+            line = line[1:]
+            bold = False
+        prefix = "*" if bold else ""
+        if len(prefix) + len(line) <= limit:
+            chunks.append(prefix + line)
+            return chunks
+        # Leave room to close a bold entity at the end of the chunk
+        cut = limit - len(prefix) - 1
+        toggles = []
+        escaped = False
+        for pos, ch in enumerate(line[:cut]):
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == "*":
+                toggles.append(pos)
+        if escaped:
+            cut -= 1  # the last character is a lone backslash
+        if toggles and toggles[-1] == cut - 1 and len(toggles) % 2 != bold:
+            cut -= 1  # don't end a chunk on an opening "*"
+            toggles.pop()
+        toggles = [pos for pos in toggles if pos < cut]
+        bold = bold != (len(toggles) % 2 == 1)
+        chunks.append(prefix + line[:cut] + ("*" if bold else ""))
+        line = line[cut:]
+
+
+def pack_messages(fragments, limit=MESSAGE_LIMIT, separator="\n\n"):
+    """Greedily join fragments into messages of at most `limit` characters.
+
+    A fragment that is too long on its own is split between lines, and a
+    line that is still too long goes through split_long_line().
+    """
+    pieces = []
+    for fragment in fragments:
+        if len(fragment) <= limit:
+            pieces.append((fragment, separator))
+            continue
+        for line in fragment.split("\n"):
+            pieces.extend((chunk, "\n") for chunk in split_long_line(line, limit))
+    messages = []
+    current = ""
+    for piece, sep in pieces:
+        if current and len(current) + len(sep) + len(piece) <= limit:
+            current += sep + piece
+            continue
+        if current:
+            messages.append(current)
+        current = piece
+    if current:
+        messages.append(current)
+    return messages
+
+
+def build_range_messages(title, start, end):
+    fragments = [safe_bold(esc(title))]
+    day = start
+    while day <= end:
+        date_str = day.strftime("%Y-%m-%d")
+        if date_str in fengshui_data:
+            fragments.append(build_day_fragment(date_str))
+        day += timedelta(days=1)
+    if len(fragments) == 1:
+        return []
+    fragments.append(esc(BOT_COPYRIGHT))
+    return pack_messages(fragments)
+
+
+async def send_batch(bot, chat_id, messages):
+    """Send messages in order, spaced out and retrying once on flood control."""
+    for i, text in enumerate(messages):
+        if i:
+            await asyncio.sleep(BATCH_SEND_INTERVAL)
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode="MarkdownV2")
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode="MarkdownV2")
+
+
+async def week(update, context):
+    start = datetime.now(TIMEZONE).date()
+    end = start + timedelta(days=6)
+    title = f"🗓️ 7 NGÀY TỚI: {start.strftime('%d/%m')} - {end.strftime('%d/%m/%Y')}"
+    messages = build_range_messages(title, start, end)
+    if not messages:
+        await update.message.reply_text("No data found for this week.")
+        return
+    await send_batch(context.bot, update.effective_chat.id, messages)
+
+
+async def month(update, context):
+    """/month [YYYY-MM], defaults to the current month."""
+    today_date = datetime.now(TIMEZONE).date()
+    arg = context.args[0] if context.args else today_date.strftime("%Y-%m")
+    # Only whole months here, not the other /bestday range forms
+    day_range = (
+        parse_day_range(arg, today_date)
+        if re.fullmatch(r"\d{4}-\d{1,2}", arg)
+        else None
+    )
+    if not day_range:
+        await update.message.reply_text("Cách dùng: /month [2025-12]")
+        return
+    start, end = day_range
+    title = f"🗓️ THÁNG {start.strftime('%m/%Y')}"
+    messages = build_range_messages(title, start, end)
+    if not messages:
+        await update.message.reply_text("No data found for this month.")
+        return
+    await send_batch(context.bot, update.effective_chat.id, messages)
+
+
+# Inline mode (@bot today, @bot 2025-12-24, @bot tuổi Đinh Mão): every answer
+# is a lookup into tables built at startup, never a fresh message build.
+INLINE_CACHE_TIME = 24 * 60 * 60  # Telegram-side cache for fixed-date answers
+INLINE_MAX_RESULTS = 10
+
+INLINE_RELATIVE_DAYS = {
+    "": 0,
+    "today": 0,
+    "hom nay": 0,
+    "homnay": 0,
+    "tomorrow": 1,
+    "mai": 1,
+    "ngay mai": 1,
+    "yesterday": -1,
+    "hom qua": -1,
+}
+
+
+def build_inline_article(date_str):
+    data = fengshui_data[date_str]
+    division = next(iter(data["division"]), "")
+    return InlineQueryResultArticle(
+        id=f"d{date_str}",
+        title=f"📅 {data['date']}",
+        description=(
+            f"ÂL {short_lunar_date(data['lunar-date'])} · Trực {division}"
+            f" · Kỵ: {', '.join(data['bad-for-age'])}"
+        ),
+        input_message_content=InputTextMessageContent(
+            build_today_message(data), parse_mode="MarkdownV2"
+        ),
+    )
+
+
+def date_keys(date_str):
+    day = datetime.strptime(date_str, "%Y-%m-%d")
+    d, m, y = day.day, day.month, day.year
+    keys = {
+        date_str,
+        f"{d}/{m}/{y}",
+        f"{d:02d}/{m:02d}/{y}",
+        f"{d}/{m}",
+        f"{d:02d}/{m:02d}",
+    }
+    return (
+        keys | {k.replace("/", "-") for k in keys} | {k.replace("/", ".") for k in keys}
+    )
+
+
+def build_prefix_table(pairs, limit=INLINE_MAX_RESULTS):
+    """Map every prefix of every key to its first `limit` distinct values.
+
+    `pairs` is (key, value) in result order; each answer is then a dict get.
+    """
+    table = {}
+    for key, value in pairs:
+        for n in range(len(key) + 1):
+            values = table.setdefault(key[:n], [])
+            if len(values) < limit and value not in values:
+                values.append(value)
+    return {prefix: tuple(values) for prefix, values in table.items()}
+
+
+def build_inline_tables():
+    """Prebuild the article for every date and the prefix lookup tables."""
+    articles = {d: build_inline_article(d) for d in sorted(fengshui_data)}
+    # Chronological, so fixed-date answers don't depend on the current day
+    date_prefixes = build_prefix_table(
+        (k, articles[d]) for d in articles for k in sorted(date_keys(d))
+    )
+    date_prefixes.pop("", None)
+    age_prefixes = build_prefix_table(
+        sorted((fold_text(a), i) for i, a in enumerate(day_features["ages"]))
+    )
+    return articles, date_prefixes, age_prefixes
+
+
+inline_articles, inline_date_prefixes, inline_age_prefixes = build_inline_tables()
+
+
+@functools.lru_cache(maxsize=4096)
+def build_age_article(age, date_str, upcoming=5):
+    """Article for one age as seen from one date; built once per (age, day)."""
+    f = day_features
+    name = f["ages"][age]
+    pos = f["date-pos"].get(date_str, bisect_left(f["dates"], date_str))
+    bad_days = [
+        f["dates"][i] for i in np.flatnonzero(f["bad-age"][pos:, age])[:upcoming] + pos
+    ]
+    lines = [safe_bold(esc(f"🚫 TUỔI {name.upper()}"))]
+    if bad_days and bad_days[0] == date_str:
+        lines.append(esc("⚠️ Hôm nay là ngày kỵ tuổi này."))
+    else:
+        lines.append(esc("🍀 Hôm nay không kỵ tuổi này."))
+    lines.append(safe_bold(esc("📅 Ngày kỵ sắp tới:")))
+    lines.extend(
+        esc(
+            f"└ {fengshui_data[d]['date']} (ÂL {short_lunar_date(fengshui_data[d]['lunar-date'])})"
+        )
+        for d in bad_days
+    )
+    return InlineQueryResultArticle(
+        id=f"a{age}-{date_str}",
+        title=f"🚫 Tuổi {name}",
+        description="Ngày kỵ sắp tới: "
+        + ", ".join(d[8:] + "/" + d[5:7] for d in bad_days),
+        input_message_content=InputTextMessageContent(
+            escape_leading_dash_per_line("\n\n".join(lines)), parse_mode="MarkdownV2"
+        ),
+    )
+
+
+def seconds_until_midnight(moment):
+    tomorrow = moment.date() + timedelta(days=1)
+    midnight = TIMEZONE.localize(datetime.combine(tomorrow, time.min))
+    return max(int((midnight - moment).total_seconds()), 1)
+
+
+def resolve_inline_query(query, moment):
+    """Return (results, cache_time) for an inline query string."""
+    # Same "Tý" -> "Tí" spelling fix as find_age(), before diacritics go
+    text = fold_text(query.lower().replace("tý", "tí"))
+    today_str = moment.strftime("%Y-%m-%d")
+    until_midnight = seconds_until_midnight(moment)
+    if text in INLINE_RELATIVE_DAYS:
+        day = moment.date() + timedelta(days=INLINE_RELATIVE_DAYS[text])
+        article = inline_articles.get(day.strftime("%Y-%m-%d"))
+        return ([article] if article else []), until_midnight
+    for prefix in ("tuoi ", "tuoi"):
+        if text.startswith(prefix):
+            ages = inline_age_prefixes.get(text[len(prefix) :].strip(), ())
+            return [build_age_article(a, today_str) for a in ages], until_midnight
+    # Short forms like "24/12" match every year in the data, oldest first
+    return list(inline_date_prefixes.get(query.strip(), ())), INLINE_CACHE_TIME
+
+
+async def inline_query(update, context):
+    results, cache_time = resolve_inline_query(
+        update.inline_query.query, datetime.now(TIMEZONE)
+    )
+    await update.inline_query.answer(results, cache_time=cache_time)
+
+
+# On-demand profiling: /profile N arms the profiler for the next N handler or
+# job runs. While disarmed, profiled() costs one dict lookup per call.
+profile_state = {
+    "remaining": 0,
+    "depth": 0,
+    "profiler": None,
+    "memory": None,
+    "chat_id": None,
+    "runs": [],
+}
+
+
+def profiled(callback):
+    """Wrap a handler or job callback so /profile can measure it."""
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        if not profile_state["remaining"]:
+            return await callback(*args, **kwargs)
+        return await run_profiled(callback, args, kwargs)
+
+    return wrapper
+
+
+async def run_profiled(callback, args, kwargs):
+    state = profile_state
+    state["remaining"] -= 1
+    # Handlers interleave on the event loop, so keep one profiler enabled
+    # while any profiled run is in flight
+    if state["depth"] == 0:
+        state["profiler"].enable()
+    state["depth"] += 1
+    started = perf_counter()
+    try:
+        return await callback(*args, **kwargs)
+    finally:
+        state["depth"] -= 1
+        if state["depth"] == 0:
+            state["profiler"].disable()
+        state["runs"].append((callback.__name__, perf_counter() - started))
+        if state["remaining"] <= 0 and state["depth"] == 0:
+            # The last positional argument is always the CallbackContext
+            finish_profiling(args[-1])
+
+
+def start_profiling(runs, chat_id, memory=False):
+    profile_state.update(
+        remaining=runs,
+        depth=0,
+        profiler=cProfile.Profile(),
+        memory=None,
+        chat_id=chat_id,
+        runs=[],
+    )
+    if memory:
+        tracemalloc.start(10)
+        profile_state["memory"] = tracemalloc.take_snapshot()
+
+
+def build_profile_report(profiler, runs, memory_before=None, snapshot=None, top=15):
+    """Return (summary text, saved file paths) for a finished profiling session."""
+    stamp = datetime.now(TIMEZONE).strftime("%Y%m%d-%H%M%S")
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    paths = [os.path.join(PROFILE_DIR, f"profile-{stamp}.prof")]
+    profiler.dump_stats(paths[0])
+
+    lines = [f"Profiled {len(runs)} run(s):"]
+    for name, seconds in runs:
+        lines.append(f"  {name}: {seconds * 1000:.1f} ms")
+
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+    lines.append(f"\nTop {top} functions (cumulative / self / calls):")
+    for (filename, lineno, func), (_, ncalls, tottime, cumtime, _) in rows[:top]:
+        lines.append(
+            f"  {cumtime * 1000:.1f} / {tottime * 1000:.1f} ms  {ncalls}x  "
+            f"{os.path.basename(filename)}:{lineno} {func}"
+        )
+
+    if snapshot is not None:
+        paths.append(os.path.join(PROFILE_DIR, f"memory-{stamp}.tracemalloc"))
+        snapshot.dump(paths[1])
+        lines.append(f"\nTop {top // 2} allocations (growth):")
+        for stat in snapshot.compare_to(memory_before, "lineno")[: top // 2]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"  {stat.size_diff / 1024:+.1f} KiB  {stat.count_diff:+d} blocks  "
+                f"{os.path.basename(frame.filename)}:{frame.lineno}"
+            )
+
+    lines.append("\nSaved: " + ", ".join(paths))
+    return "\n".join(lines), paths
+
+
+def detach_profiling():
+    """End the session in profile_state and return what the report needs."""
+    state = profile_state
+    session = {key: state[key] for key in ("profiler", "memory", "chat_id", "runs")}
+    session["snapshot"] = None
+    if state["memory"] is not None:
+        # Snapshot now so the report's own allocations don't show up
+        session["snapshot"] = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    state.update(remaining=0, profiler=None, memory=None, chat_id=None, runs=[])
+    return session
+
+
+async def report_profiling(bot, session):
+    try:
+        if session["runs"]:
+            # pstats, dump_stats and snapshot.dump do blocking file I/O
+            report, _ = await asyncio.to_thread(
+                build_profile_report,
+                session["profiler"],
+                session["runs"],
+                session["memory"],
+                session["snapshot"],
+            )
+        else:
+            report = "Profiling stopped, no runs recorded."
+        # Plain text: the report is full of MarkdownV2 reserved characters
+        await bot.send_message(chat_id=session["chat_id"], text=report[:4096])
+    except Exception as e:
+        print(f"Failed to report profiling session: {e}")
+
+
+def finish_profiling(context):
+    """Close the session and report it in the background, off the profiled run."""
+    context.application.create_task(report_profiling(context.bot, detach_profiling()))
+
+
+async def profile(update, context):
+    """Admin only: /profile <N> [mem] profiles the next N runs, /profile stop ends early."""
+    # Channel posts have no effective_user
+    user = update.effective_user
+    if user is None or user.id not in ADMIN_IDS:
+        await update.effective_message.reply_text("Not allowed.")
+        return
+    args = [a.lower() for a in context.args]
+    arg = args[0] if args else ""
+    if arg == "stop":
+        if profile_state["profiler"] is None:
+            await update.effective_message.reply_text("Profiling is off.")
+        elif profile_state["depth"]:
+            # Let the in-flight run finish and report
+            profile_state["remaining"] = 0
+            await update.effective_message.reply_text("Stopping after the current run.")
+        else:
+            finish_profiling(context)
+        return
+    if profile_state["profiler"] is not None:
+        await update.effective_message.reply_text(
+            f"Profiling already on, {profile_state['remaining']} run(s) left."
+        )
+        return
+    runs = next((max(int(a), 1) for a in args if a.isdigit()), 10)
+    memory = "mem" in args
+    start_profiling(runs, update.effective_chat.id, memory=memory)
+    await update.effective_message.reply_text(
+        f"Profiling the next {runs} handler/job run(s)"
+        + (" with tracemalloc." if memory else ".")
+    )
+
+
 def main():
     threading.Thread(target=start_health_server, daemon=True).start()
     application = Application.builder().token(TOKEN).build()
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("today", today))
+    application.add_handler(CommandHandler("start", profiled(start)))
+    application.add_handler(CommandHandler("today", profiled(today)))
+    application.add_handler(CommandHandler("now", profiled(now)))
+    application.add_handler(CommandHandler("alerts", profiled(alerts)))
+    application.add_handler(CommandHandler("bestday", profiled(bestday)))
+    application.add_handler(CommandHandler("week", profiled(week)))
+    application.add_handler(CommandHandler("month", profiled(month)))
+    application.add_handler(InlineQueryHandler(profiled(inline_query)))
+    application.add_handler(CommandHandler("profile", profile))
     # Timezone for scheduling
     tz = pytz.timezone("Asia/Bangkok")
     # Daily warning at 07:00 Asia/Bangkok
     application.job_queue.run_daily(
-        daily_warning,
+        profiled(daily_warning),
         time=datetime.strptime("07:00", "%H:%M").time().replace(tzinfo=tz),
         data=CHAT_ID,
         days=(0, 1, 2, 3, 4, 5, 6),
     )
     # Full daily reading at 09:00 Asia/Bangkok
     application.job_queue.run_daily(
-        daily_today,
+        profiled(daily_today),
         time=datetime.strptime("09:00", "%H:%M").time().replace(tzinfo=tz),
         data=CHAT_ID,
         days=(0, 1, 2, 3, 4, 5, 6),
     )
+    # Hour alerts: one job per hour boundary, rescheduled by itself
+    schedule_hour_alert(application.job_queue, datetime.now(tz))
     application.run_polling()
 
 
@@ -0,0 +1,163 @@
+"""Calendar data file formats shared by bot.py and scraping.py.
+
+Schema 1 (legacy) maps each date to a fully expanded day dict. Schema 2
+stores every repeated value once in a catalog and has each day reference
+it by integer ID:
+
+    {
+      "schema": 2,
+      "catalog": {"stars": [...], "hours": [...], "elements": [...], ...},
+      "days": {"2025-09-01": {"all-time": [0, 1, ...], "auspicious-star": [4, 9], ...}}
+    }
+
+"good-time" and "bad-time" are not stored in schema 2, they are rebuilt
+from "all-time" the same way scraping.py builds them.
+"""
+
+import json
+import os
+
+SCHEMA_VERSION = 2
+
+# Day fields in the order scraping.py emits them (schema 1 layout)
+DAY_FIELDS = [
+    "date",
+    "lunar-date",
+    "detail-lunar-date",
+    "all-time",
+    "good-time",
+    "bad-time",
+    "season-element",
+    "year-element",
+    "date-element",
+    "bad-for-age",
+    "star",
+    "animal",
+    "division",
+    "auspicious-star",
+    "inauspicious-star",
+    "depart",
+]
+
+# Fields holding a list of catalog references
+LIST_REFS = {
+    "all-time": "hours",
+    "auspicious-star": "stars",
+    "inauspicious-star": "stars",
+}
+
+# Fields holding a single catalog reference
+VALUE_REFS = {
+    "season-element": "seasons",
+    "year-element": "elements",
+    "date-element": "elements",
+    "division": "divisions",
+}
+
+CATALOGS = ["stars", "hours", "elements", "divisions", "seasons"]
+
+
+def derive_times(all_time):
+    good_time = [item for item in all_time if "🔴" in item]
+    bad_time = [item for item in all_time if "⚫️" in item]
+    return good_time, bad_time
+
+
+def pack_days(data):
+    """Convert a schema 1 {date: day} dict into a schema 2 document."""
+    catalog = {name: [] for name in CATALOGS}
+    ids = {name: {} for name in CATALOGS}
+
+    def ref(name, value):
+        key = json.dumps(value, ensure_ascii=False)
+        if key not in ids[name]:
+            ids[name][key] = len(catalog[name])
+            catalog[name].append(value)
+        return ids[name][key]
+
+    days = {}
+    for date_str, day in sorted(data.items()):
+        if (day.get("good-time"), day.get("bad-time")) != tuple(
+            derive_times(day.get("all-time", []))
+        ):
+            raise ValueError(f"{date_str}: good/bad time does not match all-time")
+        packed = {}
+        for field, value in day.items():
+            if field in ("good-time", "bad-time"):
+                continue
+            if field in LIST_REFS:
+                packed[field] = [ref(LIST_REFS[field], v) for v in value]
+            elif field in VALUE_REFS:
+                packed[field] = ref(VALUE_REFS[field], value)
+            else:
+                packed[field] = value
+        days[date_str] = packed
+    return {"schema": SCHEMA_VERSION, "catalog": catalog, "days": days}
+
+
+def unpack_day(packed, catalog):
+    """Resolve one schema 2 day back into a schema 1 day dict.
+
+    Catalog values are shared between days, not copied, so callers must
+    treat them as read-only.
+    """
+    day = {}
+    for field in DAY_FIELDS:
+        if field in ("good-time", "bad-time"):
+            continue
+        if field not in packed:
+            continue
+        value = packed[field]
+        if field in LIST_REFS:
+            table = catalog[LIST_REFS[field]]
+            day[field] = [table[i] for i in value]
+        elif field in VALUE_REFS:
+            day[field] = catalog[VALUE_REFS[field]][value]
+        else:
+            day[field] = value
+    day["good-time"], day["bad-time"] = derive_times(day.get("all-time", []))
+    return {field: day[field] for field in DAY_FIELDS if field in day}
+
+
+def unpack_days(doc):
+    catalog = doc["catalog"]
+    return {date_str: unpack_day(p, catalog) for date_str, p in doc["days"].items()}
+
+
+def read_document(path):
+    """Read a data file of either schema and return it as a schema 2 document."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    # Schema 1 files are keyed by date only, so a missing "schema" means v1
+    schema = raw.get("schema", 1)
+    if schema == 1:
+        return pack_days(raw)
+    if schema == SCHEMA_VERSION:
+        return raw
+    raise ValueError(f"{path}: unsupported schema version {schema}")
+
+
+def load_data(path):
+    """Return (days, doc): expanded schema 1 days and the schema 2 document."""
+    doc = read_document(path)
+    return unpack_days(doc), doc
+
+
+def write_data(data, path, schema=SCHEMA_VERSION):
+    """Write {date: day} to path in the given schema.
+
+    The document is built before anything is written and then swapped in
+    with os.replace, so a bad entry never leaves an empty or partial file.
+    """
+    if schema == 1:
+        text = json.dumps(dict(sorted(data.items())), ensure_ascii=False, indent=2)
+    else:
+        text = json.dumps(pack_days(data), ensure_ascii=False, separators=(",", ":"))
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
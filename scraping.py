@@ -1,8 +1,8 @@
 import requests
 from bs4 import BeautifulSoup, Tag, NavigableString
-import json
 from datetime import datetime, timedelta
 import re
+from calendar_data import SCHEMA_VERSION, load_data, write_data
 
 
 # self-declare def
@@ -416,8 +416,16 @@ def main():
     parser.add_argument("--output", type=str, help="Output JSON file", default="lich_van_nien_thoigian_2025.json")
     parser.add_argument("--merge", action="store_true", help="Merge with existing data instead of overwrite")
     parser.add_argument("--delay", type=float, help="Delay between requests (seconds)", default=0.5)
+    parser.add_argument("--schema", type=int, choices=[1, SCHEMA_VERSION], help="Output schema version", default=SCHEMA_VERSION)
+    parser.add_argument("--convert", type=str, help="Convert an existing data file to --schema and write it to --output (no scraping)")
     args = parser.parse_args()
 
+    if args.convert:
+        data, _ = load_data(args.convert)
+        write_data(data, args.output, schema=args.schema)
+        print(f"Converted {len(data)} entries from {args.convert} to schema {args.schema}: {args.output}")
+        return
+
     start_date = datetime.strptime(args.start, "%Y-%m-%d")
     end_date = datetime.strptime(args.end, "%Y-%m-%d")
     delta = timedelta(days=1)
@@ -425,8 +433,7 @@ def main():
     # Load existing data if merging
     data = {}
     if args.merge and os.path.exists(args.output):
-        with open(args.output, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data, _ = load_data(args.output)
         print(f"Loaded {len(data)} existing entries from {args.output}")
 
     current_date = start_date
@@ -462,11 +469,9 @@ def main():
         time.sleep(args.delay)  # Rate limiting
 
     # Sort by date and save
-    sorted_data = dict(sorted(data.items()))
-    with open(args.output, "w", encoding="utf-8") as f:
-        json.dump(sorted_data, f, ensure_ascii=False, indent=2)
+    write_data(data, args.output, schema=args.schema)
 
-    print(f"\nDone! Scraped {scraped_count} new entries. Total: {len(sorted_data)} entries.")
+    print(f"\nDone! Scraped {scraped_count} new entries. Total: {len(data)} entries.")
     if failed_dates:
         print(f"Failed dates: {failed_dates}")
 